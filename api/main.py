@@ -3,25 +3,145 @@ FastAPI application for Tibber energy consumption data
 """
 from fastapi import FastAPI, HTTPException, Query, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import APIKeyHeader
 from pydantic import BaseModel
-from datetime import date, datetime
-from typing import Optional, List
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from itertools import repeat
+from typing import Any, Iterator, Optional, List
+import anyio.to_thread
+import hmac
+import logging
+import orjson
+import queue
 import sqlite3
+import threading
+import time
 import os
 from pathlib import Path
 
 # Configuration
 DB_PATH = os.getenv('DATABASE_PATH', '../tibber_data.sqlite')
 API_KEY = os.getenv('API_KEY', None)  # Set API_KEY environment variable to enable authentication
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))  # Number of pooled database connections
+THREADPOOL_SIZE = int(os.getenv('API_THREADPOOL_SIZE', '64'))  # Worker threads for blocking endpoints
+STATS_CACHE_TTL = float(os.getenv('STATS_CACHE_TTL', '300'))  # Seconds to cache /api/stats
+STREAM_CHUNK_ROWS = 1024  # List responses larger than this are streamed in chunks of this many rows
+DB_URI = f"{Path(DB_PATH).resolve().as_uri()}?mode=ro"
+
+logger = logging.getLogger(__name__)
 
 # API Key security scheme
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
+
+def _orjson_default(obj: Any) -> Any:
+    """Serialize types orjson doesn't handle natively"""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson instead of the stdlib json module"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NAIVE_UTC)
+
+
+def _connect() -> sqlite3.Connection:
+    """Open a read-only database connection"""
+    try:
+        # mode=ro fails instead of creating an empty database when the file is missing
+        conn = sqlite3.connect(DB_URI, uri=True, check_same_thread=False)
+    except sqlite3.OperationalError:
+        raise HTTPException(status_code=500, detail=f"Database not found at {DB_PATH}")
+    conn.row_factory = sqlite3.Row  # Enable dict-like access
+    return conn
+
+
+class ConnectionPool:
+    """Fixed-size pool of long-lived read-only database connections"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle: queue.Queue = queue.Queue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def open(self) -> None:
+        """Pre-open all connections"""
+        while True:
+            with self._lock:
+                if self._opened >= self.size:
+                    return
+                con = _connect()
+                self._opened += 1
+            self._idle.put(con)
+
+    def get(self) -> sqlite3.Connection:
+        """Take a connection, opening a new one while below size, else wait for one"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._opened < self.size:
+                con = _connect()
+                self._opened += 1
+                return con
+
+        return self._idle.get()
+
+    def put(self, con: sqlite3.Connection) -> None:
+        """Return a connection to the pool"""
+        self._idle.put(con)
+
+    def close(self) -> None:
+        """Close all idle connections"""
+        while True:
+            try:
+                con = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            con.close()
+            with self._lock:
+                self._opened -= 1
+
+
+pool = ConnectionPool(DB_POOL_SIZE)
+
+# /api/stats scans the whole hourly table but only changes when new data is collected
+_stats_cache: Optional[tuple] = None  # (stats, expires_at)
+_stats_lock = threading.Lock()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the connection pool on startup and close it on shutdown"""
+    global _stats_cache
+
+    # Database endpoints are plain functions, so FastAPI runs them in this threadpool
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    _stats_cache = None
+    # Check for the database once here rather than on every request
+    if Path(DB_PATH).exists():
+        pool.open()
+    else:
+        logger.warning("Database not found at %s; connections will be opened on first use", DB_PATH)
+    yield
+    pool.close()
+
+
 app = FastAPI(
     title="Tibber Energy API",
     description="API for querying Tibber energy consumption data",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -72,17 +192,86 @@ class Stats(BaseModel):
     currency: Optional[str]
 
 
+# Columns returned by each list endpoint, in SELECT order. Queries name them
+# explicitly so rows can be paired with these without reading cursor.description.
+HOURLY_COLUMNS = (
+    'from_time', 'to_time', 'consumption', 'consumption_unit',
+    'cost', 'unit_price', 'unit_price_vat', 'currency'
+)
+DAILY_COLUMNS = ('date', 'total_consumption', 'total_cost', 'avg_unit_price', 'currency')
+MONTHLY_COLUMNS = ('year', 'month', 'total_consumption', 'total_cost', 'avg_unit_price', 'currency')
+
+HOURLY_SELECT = f"SELECT {', '.join(HOURLY_COLUMNS)} FROM hourly_consumption"
+DAILY_SELECT = f"SELECT {', '.join(DAILY_COLUMNS)} FROM daily_consumption"
+MONTHLY_SELECT = f"SELECT {', '.join(MONTHLY_COLUMNS)} FROM monthly_consumption"
+
+# Query text is kept constant so each pooled connection's sqlite3 statement
+# cache compiles it once; later requests only bind parameters and step.
+HOURLY_QUERIES = {
+    # (has start_date, has end_date) -> query
+    (False, False): HOURLY_SELECT + " ORDER BY from_time DESC LIMIT ?",
+    # Dates are UTC days, as in daily_consumption. The raw from_time text
+    # carries a local offset, so a range widened by a day on each side lets
+    # the from_time index narrow the scan and DATE() applies the exact bounds.
+    (True, False): (
+        HOURLY_SELECT + " WHERE from_time >= ? AND DATE(from_time) >= ? "
+        "ORDER BY from_time DESC LIMIT ?"
+    ),
+    (False, True): (
+        HOURLY_SELECT + " WHERE from_time < ? AND DATE(from_time) <= ? "
+        "ORDER BY from_time DESC LIMIT ?"
+    ),
+    (True, True): (
+        HOURLY_SELECT + " WHERE from_time >= ? AND from_time < ? "
+        "AND DATE(from_time) BETWEEN ? AND ? "
+        "ORDER BY from_time DESC LIMIT ?"
+    ),
+}
+
+DAILY_QUERIES = {
+    # (has start_date, has end_date) -> query
+    (False, False): DAILY_SELECT + " ORDER BY date DESC LIMIT ?",
+    (True, False): DAILY_SELECT + " WHERE date >= ? ORDER BY date DESC LIMIT ?",
+    (False, True): DAILY_SELECT + " WHERE date <= ? ORDER BY date DESC LIMIT ?",
+    (True, True): DAILY_SELECT + " WHERE date >= ? AND date <= ? ORDER BY date DESC LIMIT ?",
+}
+
+MONTHLY_QUERIES = {
+    # has year -> query
+    False: MONTHLY_SELECT + " ORDER BY year DESC, month DESC LIMIT ?",
+    True: MONTHLY_SELECT + " WHERE year = ? ORDER BY year DESC, month DESC LIMIT ?",
+}
+
+STATS_QUERY = """
+    SELECT
+        COUNT(*) as total_records,
+        MIN(from_time) as date_range_start,
+        MAX(from_time) as date_range_end,
+        SUM(consumption) as total_consumption_kwh,
+        SUM(cost) as total_cost,
+        MAX(currency) as currency
+    FROM hourly_consumption
+"""
+
+# MAX() is answered from the ends of the from_time index (or a single pass
+# without one), so the latest row never needs a sort
+LATEST_QUERY = HOURLY_SELECT + """
+    WHERE from_time = (SELECT MAX(from_time) FROM hourly_consumption)
+    LIMIT 1
+"""
+
+DAILY_BY_DATE_QUERY = DAILY_SELECT + " WHERE date = ?"
+
+MONTHLY_BY_YEAR_MONTH_QUERY = MONTHLY_SELECT + " WHERE year = ? AND month = ?"
+
+
 def verify_api_key(api_key: Optional[str] = Depends(api_key_header)) -> None:
     """
-    Verify API key if authentication is enabled.
-    Set API_KEY environment variable to enable authentication.
+    Verify the API key sent in the X-API-Key header.
+    Only attached to routes when the API_KEY environment variable is set.
     """
-    # If no API_KEY is set, allow all requests (backwards compatible)
-    if API_KEY is None:
-        return
-
-    # If API_KEY is set, require it in requests
-    if api_key is None or api_key != API_KEY:
+    # Constant-time comparison so response timing doesn't leak the key
+    if not hmac.compare_digest((api_key or "").encode(), API_KEY.encode()):
         raise HTTPException(
             status_code=401,
             detail="Invalid or missing API key. Include X-API-Key header.",
@@ -90,14 +279,48 @@ def verify_api_key(api_key: Optional[str] = Depends(api_key_header)) -> None:
         )
 
 
-def get_db():
-    """Get database connection"""
-    db_path = Path(DB_PATH)
-    if not db_path.exists():
-        raise HTTPException(status_code=500, detail=f"Database not found at {db_path}")
-    conn = sqlite3.connect(str(db_path), check_same_thread=False)
-    conn.row_factory = sqlite3.Row  # Enable dict-like access
-    return conn
+# If no API_KEY is set, routes get no auth dependency and allow all requests
+# (backwards compatible)
+AUTH_DEPS = [Depends(verify_api_key)] if API_KEY is not None else []
+
+
+def _as_dicts(columns: tuple, rows: List[tuple]) -> List[dict]:
+    """Pair each row tuple with the column names"""
+    # map/zip keeps the per-row loop in C instead of a comprehension frame
+    return list(map(dict, map(zip, repeat(columns), rows)))
+
+
+def _iter_json_chunks(columns: tuple, rows: List[tuple]) -> Iterator[bytes]:
+    """Encode rows as one JSON array, STREAM_CHUNK_ROWS rows at a time"""
+    yield b"["
+    for start in range(0, len(rows), STREAM_CHUNK_ROWS):
+        if start:
+            yield b","
+        chunk = _as_dicts(columns, rows[start:start + STREAM_CHUNK_ROWS])
+        yield orjson.dumps(chunk, default=_orjson_default)[1:-1]  # Strip the chunk's own brackets
+    yield b"]"
+
+
+def _rows_response(cur: sqlite3.Cursor, columns: tuple) -> Response:
+    """
+    Build a JSON array response from an executed tuple-row cursor.
+    Large results are streamed so the dicts and encoded bytes for the
+    whole result never exist at once.
+    """
+    rows = cur.fetchall()
+
+    if len(rows) <= STREAM_CHUNK_ROWS:
+        return ORJSONResponse(content=_as_dicts(columns, rows))
+    return StreamingResponse(_iter_json_chunks(columns, rows), media_type="application/json")
+
+
+def get_db() -> Iterator[sqlite3.Connection]:
+    """Get a pooled database connection"""
+    con = pool.get()
+    try:
+        yield con
+    finally:
+        pool.put(con)
 
 
 @app.get("/")
@@ -117,224 +340,196 @@ async def root():
 
 
 @app.get("/health")
-async def health():
+def health():
     """Health check endpoint"""
     try:
-        con = get_db()
-        cur = con.cursor()
-        cur.execute("SELECT 1")
-        cur.fetchone()
-        con.close()
+        con = pool.get()
+        try:
+            con.execute("SELECT 1").fetchone()
+        finally:
+            pool.put(con)
         return {"status": "healthy"}
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 
-@app.get("/api/hourly", response_model=List[HourlyConsumption], dependencies=[Depends(verify_api_key)])
-async def get_hourly_data(
+@app.get(
+    "/api/hourly",
+    responses={200: {"model": List[HourlyConsumption]}},
+    dependencies=AUTH_DEPS
+)
+def get_hourly_data(
     start_date: Optional[date] = Query(None, description="Start date (YYYY-MM-DD)"),
     end_date: Optional[date] = Query(None, description="End date (YYYY-MM-DD)"),
-    limit: int = Query(100, ge=1, le=10000, description="Maximum number of records")
+    limit: int = Query(100, ge=1, le=10000, description="Maximum number of records"),
+    con: sqlite3.Connection = Depends(get_db)
 ):
     """Get hourly consumption data"""
-    con = get_db()
     cur = con.cursor()
+    cur.row_factory = None  # Plain tuples; no per-row sqlite3.Row objects
 
-    query = "SELECT * FROM hourly_consumption WHERE 1=1"
+    query = HOURLY_QUERIES[(start_date is not None, end_date is not None)]
     params = []
 
-    if start_date:
-        query += " AND DATE(from_time) >= ?"
-        params.append(str(start_date))
+    # Index bounds on the local-time text: one day either side of the UTC
+    # range; near date.min/date.max, strings that sort before/after every date
+    if start_date is not None:
+        params.append(str(start_date - timedelta(days=1)) if start_date > date.min else '')
 
-    if end_date:
-        query += " AND DATE(from_time) <= ?"
-        params.append(str(end_date))
+    if end_date is not None:
+        params.append(
+            str(end_date + timedelta(days=2))
+            if end_date <= date.max - timedelta(days=2) else '9999-12-32'
+        )
 
-    query += " ORDER BY from_time DESC LIMIT ?"
+    params.extend(str(d) for d in (start_date, end_date) if d is not None)
     params.append(limit)
 
     try:
         cur.execute(query, params)
-        result = cur.fetchall()
-        con.close()
-
-        return [dict(row) for row in result]
+        # Rows come straight from our own schema, so skip response_model validation
+        return _rows_response(cur, HOURLY_COLUMNS)
     except Exception as e:
-        con.close()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/daily", response_model=List[DailyConsumption], dependencies=[Depends(verify_api_key)])
-async def get_daily_data(
+@app.get(
+    "/api/daily",
+    responses={200: {"model": List[DailyConsumption]}},
+    dependencies=AUTH_DEPS
+)
+def get_daily_data(
     start_date: Optional[date] = Query(None, description="Start date (YYYY-MM-DD)"),
     end_date: Optional[date] = Query(None, description="End date (YYYY-MM-DD)"),
-    limit: int = Query(365, ge=1, le=10000, description="Maximum number of records")
+    limit: int = Query(365, ge=1, le=10000, description="Maximum number of records"),
+    con: sqlite3.Connection = Depends(get_db)
 ):
     """Get daily consumption data"""
-    con = get_db()
     cur = con.cursor()
+    cur.row_factory = None
 
-    query = "SELECT * FROM daily_consumption WHERE 1=1"
-    params = []
-
-    if start_date:
-        query += " AND date >= ?"
-        params.append(str(start_date))
-
-    if end_date:
-        query += " AND date <= ?"
-        params.append(str(end_date))
-
-    query += " ORDER BY date DESC LIMIT ?"
+    query = DAILY_QUERIES[(start_date is not None, end_date is not None)]
+    params = [str(d) for d in (start_date, end_date) if d is not None]
     params.append(limit)
 
     try:
         cur.execute(query, params)
-        result = cur.fetchall()
-        con.close()
-
-        return [dict(row) for row in result]
+        return _rows_response(cur, DAILY_COLUMNS)
     except Exception as e:
-        con.close()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/monthly", response_model=List[MonthlyConsumption], dependencies=[Depends(verify_api_key)])
-async def get_monthly_data(
+@app.get(
+    "/api/monthly",
+    responses={200: {"model": List[MonthlyConsumption]}},
+    dependencies=AUTH_DEPS
+)
+def get_monthly_data(
     year: Optional[int] = Query(None, description="Year (YYYY)"),
-    limit: int = Query(24, ge=1, le=1000, description="Maximum number of records")
+    limit: int = Query(24, ge=1, le=1000, description="Maximum number of records"),
+    con: sqlite3.Connection = Depends(get_db)
 ):
     """Get monthly consumption data"""
-    con = get_db()
     cur = con.cursor()
+    cur.row_factory = None
 
-    query = "SELECT * FROM monthly_consumption WHERE 1=1"
-    params = []
-
-    if year:
-        query += " AND year = ?"
-        params.append(year)
-
-    query += " ORDER BY year DESC, month DESC LIMIT ?"
-    params.append(limit)
+    query = MONTHLY_QUERIES[year is not None]
+    params = [year, limit] if year is not None else [limit]
 
     try:
         cur.execute(query, params)
-        result = cur.fetchall()
-        con.close()
-
-        return [dict(row) for row in result]
+        return _rows_response(cur, MONTHLY_COLUMNS)
     except Exception as e:
-        con.close()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/stats", response_model=Stats, dependencies=[Depends(verify_api_key)])
-async def get_stats():
-    """Get overall statistics"""
-    con = get_db()
-    cur = con.cursor()
+@app.get("/api/stats", response_model=Stats, dependencies=AUTH_DEPS)
+def get_stats():
+    """Get overall statistics (cached for STATS_CACHE_TTL seconds)"""
+    global _stats_cache
 
-    try:
-        cur.execute("""
-            SELECT
-                COUNT(*) as total_records,
-                MIN(from_time) as date_range_start,
-                MAX(from_time) as date_range_end,
-                SUM(consumption) as total_consumption_kwh,
-                SUM(cost) as total_cost,
-                MAX(currency) as currency
-            FROM hourly_consumption
-        """)
-        result = cur.fetchone()
-        con.close()
+    # Cache hits never take a pooled connection, so they can't starve other endpoints
+    cached = _stats_cache
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
 
-        return dict(result)
-    except Exception as e:
-        con.close()
-        raise HTTPException(status_code=500, detail=str(e))
+    with _stats_lock:
+        # Another request may have refreshed the cache while we waited
+        if _stats_cache is not None and _stats_cache[1] > time.monotonic():
+            return _stats_cache[0]
+
+        con = pool.get()
+        try:
+            cur = con.cursor()
+            cur.execute(STATS_QUERY)
+            result = cur.fetchone()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            pool.put(con)
 
+        stats = dict(result)
+        _stats_cache = (stats, time.monotonic() + STATS_CACHE_TTL)
+        return stats
 
-@app.get("/api/latest", response_model=HourlyConsumption, dependencies=[Depends(verify_api_key)])
-async def get_latest():
+
+@app.get("/api/latest", response_model=HourlyConsumption, dependencies=AUTH_DEPS)
+def get_latest(con: sqlite3.Connection = Depends(get_db)):
     """Get the most recent consumption record"""
-    con = get_db()
     cur = con.cursor()
 
     try:
-        cur.execute("""
-            SELECT * FROM hourly_consumption
-            ORDER BY from_time DESC
-            LIMIT 1
-        """)
+        cur.execute(LATEST_QUERY)
         result = cur.fetchone()
 
         if not result:
             raise HTTPException(status_code=404, detail="No data found")
 
-        con.close()
-
         return dict(result)
     except HTTPException:
         raise
     except Exception as e:
-        con.close()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/daily/{date}", response_model=DailyConsumption, dependencies=[Depends(verify_api_key)])
-async def get_daily_by_date(date: date):
+@app.get("/api/daily/{date}", response_model=DailyConsumption, dependencies=AUTH_DEPS)
+def get_daily_by_date(date: date, con: sqlite3.Connection = Depends(get_db)):
     """Get consumption for a specific date"""
-    con = get_db()
     cur = con.cursor()
 
     try:
-        cur.execute(
-            "SELECT * FROM daily_consumption WHERE date = ?",
-            [str(date)]
-        )
+        cur.execute(DAILY_BY_DATE_QUERY, [str(date)])
         result = cur.fetchone()
 
         if not result:
             raise HTTPException(status_code=404, detail=f"No data found for {date}")
 
-        con.close()
-
         return dict(result)
     except HTTPException:
         raise
     except Exception as e:
-        con.close()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/monthly/{year}/{month}", response_model=MonthlyConsumption, dependencies=[Depends(verify_api_key)])
-async def get_monthly_by_year_month(year: int, month: int):
+@app.get("/api/monthly/{year}/{month}", response_model=MonthlyConsumption, dependencies=AUTH_DEPS)
+def get_monthly_by_year_month(year: int, month: int, con: sqlite3.Connection = Depends(get_db)):
     """Get consumption for a specific month"""
     if not (1 <= month <= 12):
         raise HTTPException(status_code=400, detail="Month must be between 1 and 12")
 
-    con = get_db()
     cur = con.cursor()
 
     try:
-        cur.execute(
-            "SELECT * FROM monthly_consumption WHERE year = ? AND month = ?",
-            [year, month]
-        )
+        cur.execute(MONTHLY_BY_YEAR_MONTH_QUERY, [year, month])
         result = cur.fetchone()
 
         if not result:
             raise HTTPException(status_code=404, detail=f"No data found for {year}-{month:02d}")
 
-        con.close()
-
         return dict(result)
     except HTTPException:
         raise
     except Exception as e:
-        con.close()
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -6,6 +6,34 @@ import duckdb
 import sqlite3
 from pathlib import Path
 
+BATCH_SIZE = 10_000  # Rows streamed from DuckDB per executemany call
+
+# Column names with DuckDB types already mapped to SQLite storage classes
+COLUMNS_QUERY = """
+    SELECT
+        column_name,
+        CASE
+            WHEN data_type IN ('DOUBLE', 'FLOAT') THEN 'REAL'
+            WHEN data_type IN ('TINYINT', 'SMALLINT', 'INTEGER', 'BIGINT',
+                               'UTINYINT', 'USMALLINT', 'UINTEGER', 'UBIGINT') THEN 'INTEGER'
+            ELSE 'TEXT'  -- VARCHAR, DATE and TIMESTAMP values are stored as text
+        END AS sqlite_type
+    FROM duckdb_columns()
+    WHERE schema_name = 'main' AND table_name = ?
+    ORDER BY column_index
+"""
+
+# Indexes backing the API's ORDER BY/LIMIT and range queries (table -> columns)
+INDEXES = {
+    'hourly_consumption': ['from_time'],
+    'daily_consumption': ['date'],
+    'monthly_consumption': ['year', 'month'],
+}
+
+def quote_identifier(name: str) -> str:
+    """Quote a table or column name for use in SQL"""
+    return '"' + name.replace('"', '""') + '"'
+
 def convert_duckdb_to_sqlite(duckdb_path: str, sqlite_path: str):
     """Convert DuckDB database to SQLite"""
 
@@ -19,6 +47,14 @@ def convert_duckdb_to_sqlite(duckdb_path: str, sqlite_path: str):
     sqlite_con = sqlite3.connect(sqlite_path)
     sqlite_cur = sqlite_con.cursor()
 
+    # Bulk-load settings: the whole copy is one transaction, so durability
+    # only matters at the final commit
+    sqlite_cur.execute("PRAGMA journal_mode=WAL")
+    sqlite_cur.execute("PRAGMA synchronous=OFF")
+    sqlite_cur.execute("PRAGMA temp_store=MEMORY")
+    sqlite_cur.execute("PRAGMA cache_size=-200000")
+    sqlite_cur.execute("BEGIN")
+
     # Get list of tables
     tables = duck_con.execute("SHOW TABLES").fetchall()
     print(f"\nFound {len(tables)} tables: {[t[0] for t in tables]}")
@@ -27,47 +63,48 @@ def convert_duckdb_to_sqlite(duckdb_path: str, sqlite_path: str):
         print(f"\nConverting table: {table_name}")
 
         # Get table schema
-        schema = duck_con.execute(f"PRAGMA table_info('{table_name}')").fetchall()
+        schema = duck_con.execute(COLUMNS_QUERY, [table_name]).fetchall()
+        table = quote_identifier(table_name)
 
         # Create table in SQLite
-        columns = []
-        for col in schema:
-            col_name = col[1]
-            col_type = col[2]
-            # Map DuckDB types to SQLite types
-            if 'VARCHAR' in col_type.upper() or 'TEXT' in col_type.upper():
-                sqlite_type = 'TEXT'
-            elif 'DOUBLE' in col_type.upper() or 'FLOAT' in col_type.upper():
-                sqlite_type = 'REAL'
-            elif 'BIGINT' in col_type.upper() or 'INTEGER' in col_type.upper():
-                sqlite_type = 'INTEGER'
-            elif 'TIMESTAMP' in col_type.upper():
-                sqlite_type = 'TEXT'  # Store timestamps as text
-            elif 'DATE' in col_type.upper():
-                sqlite_type = 'TEXT'
-            else:
-                sqlite_type = 'TEXT'  # Default to TEXT
-
-            columns.append(f"{col_name} {sqlite_type}")
-
-        create_table_sql = f"CREATE TABLE {table_name} ({', '.join(columns)})"
+        columns = [f"{quote_identifier(col_name)} {sqlite_type}" for col_name, sqlite_type in schema]
+        create_table_sql = f"CREATE TABLE {table} ({', '.join(columns)})"
         print(f"Creating table: {create_table_sql}")
-        sqlite_cur.execute(f"DROP TABLE IF EXISTS {table_name}")
+        sqlite_cur.execute(f"DROP TABLE IF EXISTS {table}")
         sqlite_cur.execute(create_table_sql)
 
-        # Copy data
-        rows = duck_con.execute(f"SELECT * FROM {table_name}").fetchall()
-        print(f"Copying {len(rows)} rows...")
+        # Copy data in batches so only one chunk is held in memory
+        placeholders = ','.join(['?' for _ in schema])
+        insert_sql = f"INSERT INTO {table} VALUES ({placeholders})"
+        duck_cur = duck_con.execute(f"SELECT * FROM {table}")
+        row_count = 0
 
-        if rows:
-            placeholders = ','.join(['?' for _ in rows[0]])
-            insert_sql = f"INSERT INTO {table_name} VALUES ({placeholders})"
+        while True:
+            rows = duck_cur.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
             sqlite_cur.executemany(insert_sql, rows)
+            row_count += len(rows)
+
+        print(f"Copied {row_count} rows")
+
+        if table_name in INDEXES:
+            index_columns = INDEXES[table_name]
+            index_name = quote_identifier(f"idx_{table_name}_{'_'.join(index_columns)}")
+            sqlite_cur.execute(
+                f"CREATE INDEX {index_name} ON {table} ({', '.join(map(quote_identifier, index_columns))})"
+            )
+            print(f"Created index on {', '.join(index_columns)}")
 
         print(f"✓ Completed {table_name}")
 
-    # Commit and close
+    # Commit and close. Switch back to a rollback journal so the result stays
+    # a single self-contained file that can be copied elsewhere.
     sqlite_con.commit()
+    sqlite_cur.execute("PRAGMA journal_mode=DELETE")
+
+    # Gather statistics so the query planner knows table and index sizes
+    sqlite_cur.execute("ANALYZE")
     duck_con.close()
     sqlite_con.close()
 
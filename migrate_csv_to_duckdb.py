@@ -2,7 +2,6 @@
 Migrate CSV data to DuckDB
 """
 import duckdb
-import polars as pl
 from pathlib import Path
 
 CSV_FILE = "tibber_consumption_data.csv"
@@ -25,19 +24,6 @@ def migrate():
             return
         db_path.unlink()
 
-    print(f"📖 Reading CSV file: {csv_path}")
-    df = pl.read_csv(csv_path, separator='\t')
-    print(f"   Found {len(df)} records")
-
-    # Rename columns to match DuckDB schema
-    df_renamed = df.rename({
-        'from': 'from_time',
-        'to': 'to_time',
-        'consumptionUnit': 'consumption_unit',
-        'unitPrice': 'unit_price',
-        'unitPriceVAT': 'unit_price_vat'
-    })
-
     print(f"💾 Creating database: {db_path}")
     con = duckdb.connect(str(db_path))
 
@@ -80,43 +66,74 @@ def migrate():
         )
     """)
 
-    # Insert data
-    print("📥 Inserting data...")
+    # Insert data straight from the CSV, renaming columns to match the DuckDB schema
+    print(f"📥 Inserting data from {csv_path}...")
     con.execute("""
-        INSERT INTO hourly_consumption
-        SELECT * FROM df_renamed
-    """)
-
-    # Create aggregations
-    print("📊 Creating daily aggregations...")
+        INSERT INTO hourly_consumption (
+            from_time, to_time, consumption, consumption_unit,
+            cost, unit_price, unit_price_vat, currency
+        )
+        SELECT
+            "from" AS from_time,
+            "to" AS to_time,
+            consumption,
+            consumptionUnit AS consumption_unit,
+            cost,
+            unitPrice AS unit_price,
+            unitPriceVAT AS unit_price_vat,
+            currency
+        FROM read_csv_auto(?, delim='\t', header=true)
+    """, [str(csv_path)])
+
+    # Create aggregations: one scan of hourly_consumption grouped both ways,
+    # then each aggregation table takes its own grouping set
+    print("📊 Creating daily and monthly aggregations...")
     con.execute("""
-        INSERT INTO daily_consumption
+        CREATE TEMP TABLE consumption_rollup AS
+        WITH src AS (
+            SELECT
+                CAST(from_time AS DATE) as date,
+                EXTRACT(YEAR FROM from_time) as year,
+                EXTRACT(MONTH FROM from_time) as month,
+                consumption,
+                cost,
+                unit_price,
+                currency
+            FROM hourly_consumption
+            WHERE consumption IS NOT NULL
+        )
         SELECT
-            CAST(from_time AS DATE) as date,
+            date,
+            year,
+            month,
+            GROUPING(date) as is_monthly,
             SUM(consumption) as total_consumption,
             SUM(cost) as total_cost,
             AVG(unit_price) as avg_unit_price,
             MAX(currency) as currency
-        FROM hourly_consumption
-        WHERE consumption IS NOT NULL
-        GROUP BY CAST(from_time AS DATE)
+        FROM src
+        GROUP BY GROUPING SETS ((date), (year, month))
+    """)
+
+    con.execute("""
+        INSERT INTO daily_consumption
+        SELECT date, total_consumption, total_cost, avg_unit_price, currency
+        FROM consumption_rollup
+        WHERE is_monthly = 0
     """)
 
-    print("📊 Creating monthly aggregations...")
     con.execute("""
         INSERT INTO monthly_consumption
-        SELECT
-            EXTRACT(YEAR FROM from_time) as year,
-            EXTRACT(MONTH FROM from_time) as month,
-            SUM(consumption) as total_consumption,
-            SUM(cost) as total_cost,
-            AVG(unit_price) as avg_unit_price,
-            MAX(currency) as currency
-        FROM hourly_consumption
-        WHERE consumption IS NOT NULL
-        GROUP BY EXTRACT(YEAR FROM from_time), EXTRACT(MONTH FROM from_time)
+        SELECT year, month, total_consumption, total_cost, avg_unit_price, currency
+        FROM consumption_rollup
+        WHERE is_monthly = 1
     """)
 
+    con.execute("DROP TABLE consumption_rollup")
+
+    # Refresh table statistics for the query planner
+    con.execute("ANALYZE")
+
     # Print stats
     hourly_count = con.execute("SELECT COUNT(*) FROM hourly_consumption").fetchone()[0]
     daily_count = con.execute("SELECT COUNT(*) FROM daily_consumption").fetchone()[0]
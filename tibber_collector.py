@@ -17,20 +17,117 @@ real-time WebSocket API or the REST Data API.
 """
 
 import httpx
+import orjson
 import polars as pl
 import duckdb
+import hashlib
 import json
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from pathlib import Path
 import os
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
+import math
 import time
 import dotenv
 
 dotenv.load_dotenv()
 
+# Approximate span of one record per resolution, used to size the first page
+RESOLUTION_STEPS = {
+    'HOURLY': timedelta(hours=1),
+    'DAILY': timedelta(days=1),
+    'WEEKLY': timedelta(weeks=1),
+    'MONTHLY': timedelta(days=28),
+    'ANNUAL': timedelta(days=365),
+}
+
+# Upper bound on records requested in a single page
+MAX_PAGE_SIZE = 5000
+
+# Pause between pages only once the remaining request quota drops this low
+RATE_LIMIT_LOW_WATERMARK = 50
+
+# DuckDB resource limits sized for a Raspberry Pi
+DUCKDB_THREADS = 4
+DUCKDB_MEMORY_LIMIT = '512MB'
+
+# Column types of a consumption node, so frames skip type inference
+EDGE_SCHEMA = {
+    'from': pl.Utf8,
+    'to': pl.Utf8,
+    'consumption': pl.Float64,
+    'consumptionUnit': pl.Utf8,
+    'cost': pl.Float64,
+    'unitPrice': pl.Float64,
+    'unitPriceVAT': pl.Float64,
+    'currency': pl.Utf8,
+}
+
+# Selection set of a consumption connection; %s is the selected node fields
+CONSUMPTION_SELECTION = """{
+        pageInfo {
+          hasPreviousPage
+          startCursor
+        }
+        edges {
+          node {
+            %s
+          }
+        }
+      }"""
+
+# Static consumption query; pagination values are sent as variables so the
+# document is identical on every request
+CONSUMPTION_QUERY = """
+query Consumption($homeId: ID!, $resolution: EnergyResolution!, $last: Int, $before: String) {
+  viewer {
+    home(id: $homeId) {
+      consumption(resolution: $resolution, last: $last, before: $before) %s
+    }
+  }
+}
+"""
+
+# Several homes in one request, each under its own alias
+MULTI_HOME_QUERY = """
+query MultiConsumption($resolution: EnergyResolution!, $last: Int%s) {
+  viewer {%s
+  }
+}
+"""
+
+MULTI_HOME_FIELD = """
+    %(alias)s: home(id: $%(alias)s) {
+      consumption(resolution: $resolution, last: $last, before: $%(alias)s_before) %(selection)s
+    }"""
+
+# Node fields requested when the caller doesn't narrow the selection
+DEFAULT_FIELDS = tuple(EDGE_SCHEMA)
+
+
+@lru_cache(maxsize=None)
+def _consumption_document(fields: Tuple[str, ...]) -> str:
+    """Consumption query selecting only the given node fields"""
+    return CONSUMPTION_QUERY % (CONSUMPTION_SELECTION % '\n            '.join(fields))
+
+
+@lru_cache(maxsize=None)
+def _multi_home_document(aliases: Tuple[str, ...], fields: Tuple[str, ...]) -> str:
+    """Aliased consumption query for the given homes and node fields"""
+    selection = CONSUMPTION_SELECTION % '\n            '.join(fields)
+    variables = ''.join(f', ${alias}: ID!, ${alias}_before: String' for alias in aliases)
+    homes = ''.join(
+        MULTI_HOME_FIELD % {'alias': alias, 'selection': selection} for alias in aliases
+    )
+    return MULTI_HOME_QUERY % (variables, homes)
+
 class TibberCollector:
     """Collects energy consumption data from Tibber API"""
+
+    # Home IDs resolved in this process, keyed like the collection_state cache
+    _home_ids: Dict[str, str] = {}
     
     def __init__(
         self,
@@ -62,61 +159,124 @@ class TibberCollector:
             'Content-Type': 'application/json',
             'Authorization': f'Bearer {self.access_token}'
         }
+
+        # One client for the collector's lifetime so every page reuses the
+        # same keep-alive connection instead of a fresh TLS handshake;
+        # HTTP/2 lets any later requests share that single connection
+        self._client = httpx.Client(
+            http2=True,
+            headers=self.headers,
+            limits=httpx.Limits(max_keepalive_connections=4),
+            timeout=60.0  # Increased timeout for slower connections
+        )
+        # Remaining request quota reported by the API, if it sends one, and
+        # when that quota resets (time.monotonic() deadline)
+        self._rate_remaining: Optional[int] = None
+        self._rate_reset_at: Optional[float] = None
         
+        # Keep one connection open for the collector's lifetime
+        self.con = duckdb.connect(str(self.db_path))
+        self.con.execute(f"SET threads = {DUCKDB_THREADS}")
+        self.con.execute(f"SET memory_limit = '{DUCKDB_MEMORY_LIMIT}'")
+
+        # Initialize database before the home lookup, which is cached in it
+        self._init_database()
+
+        # Last stored timestamp, memoised until the next save changes it
+        self._last_timestamp: Optional[datetime] = None
+        self._last_timestamp_loaded = False
+
+        # Set when home_id came from the cache and may be stale
+        self._home_id_cached = False
+
         if not self.home_id:
             # Try to fetch home ID automatically
             self.home_id = self._get_home_id()
 
-        # Initialize database
-        self._init_database()
+    def __enter__(self) -> "TibberCollector":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the HTTP connection pool and the database connection"""
+        self._client.close()
+        self.con.close()
     
     def _init_database(self) -> None:
         """Initialize DuckDB database and create tables if they don't exist"""
-        with duckdb.connect(str(self.db_path)) as con:
-            # Create hourly consumption table
-            con.execute("""
-                CREATE TABLE IF NOT EXISTS hourly_consumption (
-                    from_time TIMESTAMP WITH TIME ZONE,
-                    to_time TIMESTAMP WITH TIME ZONE,
-                    consumption DOUBLE,
-                    consumption_unit VARCHAR,
-                    cost DOUBLE,
-                    unit_price DOUBLE,
-                    unit_price_vat DOUBLE,
-                    currency VARCHAR,
-                    PRIMARY KEY (from_time, to_time)
-                )
-            """)
-
-            # Create daily aggregation table
-            con.execute("""
-                CREATE TABLE IF NOT EXISTS daily_consumption (
-                    date DATE,
-                    total_consumption DOUBLE,
-                    total_cost DOUBLE,
-                    avg_unit_price DOUBLE,
-                    currency VARCHAR,
-                    PRIMARY KEY (date)
-                )
-            """)
-
-            # Create monthly aggregation table
-            con.execute("""
-                CREATE TABLE IF NOT EXISTS monthly_consumption (
-                    year INTEGER,
-                    month INTEGER,
-                    total_consumption DOUBLE,
-                    total_cost DOUBLE,
-                    avg_unit_price DOUBLE,
-                    currency VARCHAR,
-                    PRIMARY KEY (year, month)
-                )
-            """)
-
-            print(f"✅ Database initialized at {self.db_path}")
+        con = self.con
+        # Create hourly consumption table
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS hourly_consumption (
+                from_time TIMESTAMP WITH TIME ZONE,
+                to_time TIMESTAMP WITH TIME ZONE,
+                consumption DOUBLE,
+                consumption_unit VARCHAR,
+                cost DOUBLE,
+                unit_price DOUBLE,
+                unit_price_vat DOUBLE,
+                currency VARCHAR,
+                PRIMARY KEY (from_time, to_time)
+            )
+        """)
+
+        # Create daily aggregation table
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS daily_consumption (
+                date DATE,
+                total_consumption DOUBLE,
+                total_cost DOUBLE,
+                avg_unit_price DOUBLE,
+                currency VARCHAR,
+                PRIMARY KEY (date)
+            )
+        """)
+
+        # Create monthly aggregation table
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS monthly_consumption (
+                year INTEGER,
+                month INTEGER,
+                total_consumption DOUBLE,
+                total_cost DOUBLE,
+                avg_unit_price DOUBLE,
+                currency VARCHAR,
+                PRIMARY KEY (year, month)
+            )
+        """)
+
+        # Small key/value table for collection bookkeeping, so lookups
+        # like the last stored timestamp don't scan the hourly table
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS collection_state (
+                key VARCHAR PRIMARY KEY,
+                value VARCHAR
+            )
+        """)
+
+        print(f"✅ Database initialized at {self.db_path}")
+
+    def _get_home_id(self, use_cache: bool = True) -> str:
+        """Automatically fetch the first available home ID, cached per token"""
+        # Key the cache on the token so switching accounts looks up again
+        token_hash = hashlib.sha256(self.access_token.encode()).hexdigest()[:16]
+        cache_key = f'home_id:{token_hash}'
+        if use_cache:
+            cached = TibberCollector._home_ids.get(cache_key)
+            if cached is None:
+                row = self.con.execute(
+                    "SELECT value FROM collection_state WHERE key = ?", [cache_key]
+                ).fetchone()
+                cached = row[0] if row else None
+            if cached:
+                print(f"✅ Using cached home ID: {cached}")
+                TibberCollector._home_ids[cache_key] = cached
+                self._home_id_cached = True
+                return cached
+        self._home_id_cached = False
 
-    def _get_home_id(self) -> str:
-        """Automatically fetch the first available home ID"""
         query = """
         {
           viewer {
@@ -139,6 +299,11 @@ class TibberCollector:
         
         home = homes[0]
         print(f"✅ Using home: {home.get('appNickname', 'N/A')} (ID: {home['id']})")
+        self.con.execute(
+            "INSERT OR REPLACE INTO collection_state VALUES (?, ?)",
+            [cache_key, home['id']]
+        )
+        TibberCollector._home_ids[cache_key] = home['id']
         return home['id']
     
     def _make_request(self, payload: Dict[str, Any], retries: int = 3) -> Dict[str, Any]:
@@ -154,26 +319,23 @@ class TibberCollector:
         """
         for attempt in range(retries):
             try:
-                response = httpx.post(
-                    self.api_url,
-                    json=payload,
-                    headers=self.headers,
-                    timeout=60.0  # Increased timeout for slower connections
-                )
+                response = self._client.post(self.api_url, json=payload)
+                self._record_rate_limit(response)
                 
                 if response.status_code == 200:
-                    data = response.json()
+                    # orjson decodes the raw bytes without an intermediate str
+                    data = orjson.loads(response.content)
                     if 'errors' in data:
                         print(f"⚠️  GraphQL errors: {data['errors']}")
                     return data
                 elif response.status_code == 429:
                     # Rate limited - wait and retry
-                    wait_time = 2 ** attempt
+                    wait_time = self._retry_delay(response, attempt)
                     print(f"⚠️  Rate limited. Waiting {wait_time}s before retry...")
                     time.sleep(wait_time)
                 elif response.status_code == 504:
                     # Gateway timeout - wait and retry
-                    wait_time = 2 ** attempt
+                    wait_time = self._retry_delay(response, attempt)
                     print(f"⚠️  Gateway timeout. Waiting {wait_time}s before retry...")
                     time.sleep(wait_time)
                 else:
@@ -185,20 +347,68 @@ class TibberCollector:
                     time.sleep(1)
         
         raise Exception(f"Failed to make request after {retries} attempts")
+
+    def _record_rate_limit(self, response: httpx.Response) -> None:
+        """Remember the quota and reset time from X-RateLimit-* headers"""
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        if remaining is not None and remaining.isdigit():
+            self._rate_remaining = int(remaining)
+
+        reset = response.headers.get('X-RateLimit-Reset')
+        try:
+            reset_in = float(reset)
+        except (TypeError, ValueError):
+            return
+        # Servers send either seconds until reset or an epoch timestamp
+        if reset_in > 1e9:
+            reset_in -= time.time()
+        self._rate_reset_at = time.monotonic() + max(0.0, reset_in)
+
+    def _pause_between_pages(self) -> None:
+        """Pace page requests by the reported quota, skipping the pause while plenty is left"""
+        remaining = self._rate_remaining
+        if remaining is not None and remaining > RATE_LIMIT_LOW_WATERMARK:
+            return
+
+        delay = 0.3
+        if remaining is not None and self._rate_reset_at is not None:
+            # Spread what is left of the quota over the time until it resets
+            reset_in = self._rate_reset_at - time.monotonic()
+            delay = max(delay, reset_in / max(remaining, 1))
+        time.sleep(min(delay, 60.0))
+
+    @staticmethod
+    def _retry_delay(response: httpx.Response, attempt: int) -> float:
+        """Seconds to wait before retrying, preferring the server's Retry-After hint"""
+        retry_after = response.headers.get('Retry-After')
+        try:
+            return max(0.0, float(retry_after))
+        except (TypeError, ValueError):
+            return 2 ** attempt
     
     def _get_last_timestamp(self) -> Optional[datetime]:
         """Get the timestamp of the most recent data point in storage"""
+        if self._last_timestamp_loaded:
+            return self._last_timestamp
+
         try:
-            with duckdb.connect(str(self.db_path)) as con:
+            con = self.con
+            result = con.execute("""
+                SELECT CAST(value AS TIMESTAMPTZ)
+                FROM collection_state
+                WHERE key = 'last_from_time'
+            """).fetchone()
+
+            if result is None:
+                # Databases written before collection_state existed
                 result = con.execute("""
                     SELECT MAX(from_time) as last_time
                     FROM hourly_consumption
                 """).fetchone()
 
-                if result and result[0]:
-                    # Convert to Python datetime
-                    return result[0]
-                return None
+            self._last_timestamp = result[0] if result else None
+            self._last_timestamp_loaded = True
+            return self._last_timestamp
         except Exception as e:
             print(f"⚠️  Could not read last timestamp: {e}")
             return None
@@ -208,7 +418,8 @@ class TibberCollector:
         since: Optional[datetime] = None,
         until: Optional[datetime] = None,
         resolution: str = "HOURLY",
-        max_records: Optional[int] = None
+        max_records: Optional[int] = None,
+        fields: Tuple[str, ...] = DEFAULT_FIELDS
     ) -> pl.DataFrame:
         """
         Fetch consumption data with pagination
@@ -218,6 +429,9 @@ class TibberCollector:
             until: End datetime (defaults to now)
             resolution: Data resolution (HOURLY, DAILY, WEEKLY, MONTHLY, ANNUAL)
             max_records: Maximum number of records to fetch (None = all)
+            fields: Node fields to request; 'from' and 'to' are always
+                included and columns not requested are returned as nulls,
+                so a narrowed frame must not be passed to save_data
             
         Returns:
             Polars DataFrame with consumption data
@@ -245,18 +459,23 @@ class TibberCollector:
         
         print(f"📅 Date range: {since.isoformat()} to {until.isoformat()}")
         print(f"📊 Resolution: {resolution}")
-        
+
+        page_schema = self._page_schema(fields)
+        fields = tuple(page_schema)
+
         # Fetch all pages
-        all_edges = []
+        frames = []
+        collected = 0
         cursor = None
         page_count = 0
         
-        # Tibber typically allows up to ~10,000 quarter-hourly records
-        # That's about 104 days of data
-        page_size = 1000  # Fetch 1000 records per page
+        # Paging starts at the newest record, so size the page to reach back
+        # to `since` from now; an incremental run or the initial 90-day
+        # backfill then usually needs a single request
+        page_size = self._page_size(since, resolution, max_records)
         
         while True:
-            if max_records and len(all_edges) >= max_records:
+            if max_records and collected >= max_records:
                 print(f"✅ Reached max records limit ({max_records})")
                 break
 
@@ -264,27 +483,32 @@ class TibberCollector:
             print(f"📄 Fetching page {page_count}...")
 
             # Build query with pagination
-            # Use 'last' on first page to get most recent data
-            if cursor is None:
-                query = self._build_consumption_query(
-                    resolution=resolution,
-                    last=page_size
-                )
-            else:
-                query = self._build_consumption_query(
-                    resolution=resolution,
-                    first=page_size,
-                    after=cursor
-                )
+            # Use 'last' to get the most recent data, then walk backwards
+            # with 'before' if the range spans more than one page
+            payload = self._build_consumption_query(
+                resolution=resolution,
+                last=page_size,
+                before=cursor,
+                fields=fields
+            )
             
-            response = self._make_request({'query': query})
+            response = self._make_request(payload)
+            
+            # The cached home ID is used without checking it first; if the
+            # API no longer knows it, look it up again and retry the page
+            home = ((response.get('data') or {}).get('viewer') or {}).get('home')
+            if home is None and self._home_id_cached:
+                print("⚠️  Cached home ID not found, looking it up again")
+                self.home_id = self._get_home_id(use_cache=False)
+                page_count -= 1
+                continue
             
             # Extract data
             try:
-                consumption = response['data']['viewer']['home']['consumption']
+                consumption = home['consumption']
                 edges = consumption['edges']
                 page_info = consumption['pageInfo']
-            except KeyError as e:
+            except (KeyError, TypeError) as e:
                 print(f"❌ Unexpected response structure: {e}")
                 break
             
@@ -294,129 +518,244 @@ class TibberCollector:
                 print("✅ No more data available")
                 break
             
+            # Keep only the records inside the requested date range
+            page_df = self._page_frame(self._nodes_in_range(edges, since, until), page_schema)
+            frames.append(page_df)
+            collected += len(page_df)
+            
             # Check date range
-            if edges:
-                first_date_str = edges[0]['node']['from']
-                last_date_str = edges[-1]['node']['from']
-                
-                # Parse dates - handle both 'Z' and timezone offsets
-                first_date = datetime.fromisoformat(first_date_str.replace('Z', '+00:00'))
-                last_date = datetime.fromisoformat(last_date_str.replace('Z', '+00:00'))
-                
-                print(f"   Date range: {first_date} to {last_date}")
-                
-                # Tibber API returns data in reverse chronological order (newest first)
-                # Stop if the oldest date in this page is before our 'since' date
-                oldest_in_page = min(first_date, last_date)
-                if since and oldest_in_page < since:
-                    print(f"✅ Reached target start date ({since})")
-                    # Filter edges to only include dates >= since
-                    edges = [
-                        e for e in edges 
-                        if datetime.fromisoformat(e['node']['from'].replace('Z', '+00:00')) >= since
-                    ]
-                    all_edges.extend(edges)
-                    break
+            first_date_str = edges[0]['node']['from']
+            last_date_str = edges[-1]['node']['from']
+            
+            # Parse dates - fromisoformat handles both 'Z' and timezone
+            # offsets on Python 3.11+
+            first_date = datetime.fromisoformat(first_date_str)
+            last_date = datetime.fromisoformat(last_date_str)
             
-            all_edges.extend(edges)
+            print(f"   Date range: {first_date} to {last_date}")
+            
+            # Stop if the oldest date in this page is before our 'since' date
+            oldest_in_page = min(first_date, last_date)
+            if oldest_in_page < since:
+                print(f"✅ Reached target start date ({since})")
+                break
             
-            # Check if there are more pages
-            if not page_info.get('hasNextPage', False):
+            # Check if there are older pages
+            if not page_info.get('hasPreviousPage', False):
                 print("✅ No more pages available")
                 break
             
-            cursor = page_info['endCursor']
+            cursor = page_info['startCursor']
+            # The range reaches past the first page; continue with full pages
+            page_size = MAX_PAGE_SIZE
+            if max_records:
+                page_size = min(page_size, max_records - collected)
             
             # Small delay to be respectful to the API
-            time.sleep(0.3)
+            self._pause_between_pages()
         
-        print(f"\n📊 Total records collected: {len(all_edges)}")
+        print(f"\n📊 Total records collected: {collected}")
         
-        if not all_edges:
+        if not collected:
             print("ℹ️  No new data to collect")
-            return pl.DataFrame()
-        
-        # Convert to DataFrame
-        df = pl.DataFrame([edge['node'] for edge in all_edges])
-        
-        # Filter by date range if specified
-        if since or until:
-            # Parse datetime strings with timezone information
-            df = df.with_columns(
-                pl.col('from').map_elements(
-                    lambda x: datetime.fromisoformat(x.replace('Z', '+00:00')),
-                    return_dtype=pl.Datetime("us", "UTC")
-                ).alias('from_dt')
-            )
-
-            if since:
-                # Convert since to UTC for comparison
-                since_utc = since.astimezone(timezone.utc) if since.tzinfo else since.replace(tzinfo=timezone.utc)
-                df = df.filter(pl.col('from_dt') >= since_utc)
-            if until:
-                # Convert until to UTC for comparison
-                until_utc = until.astimezone(timezone.utc) if until.tzinfo else until.replace(tzinfo=timezone.utc)
-                df = df.filter(pl.col('from_dt') <= until_utc)
-
-            df = df.drop('from_dt')
+            return pl.DataFrame(schema=EDGE_SCHEMA)
         
+        df = self._combine_pages(frames)
         print(f"✅ Final dataset: {len(df)} records")
         return df
+
+    def fetch_multi(
+        self,
+        home_ids: List[str],
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        resolution: str = "HOURLY",
+        fields: Tuple[str, ...] = DEFAULT_FIELDS
+    ) -> Dict[str, pl.DataFrame]:
+        """
+        Fetch consumption data for several homes with one aliased request per page
+
+        Args:
+            home_ids: Tibber home IDs to fetch
+            since: Start datetime (defaults to 90 days before until)
+            until: End datetime (defaults to now)
+            resolution: Data resolution (HOURLY, DAILY, WEEKLY, MONTHLY, ANNUAL)
+            fields: Node fields to request (see fetch_consumption_data)
+
+        Returns:
+            Dict mapping each home ID to a Polars DataFrame
+        """
+        if until is None:
+            until = datetime.now(timezone.utc)
+        elif until.tzinfo is None:
+            until = until.replace(tzinfo=timezone.utc)
+
+        if since is None:
+            since = until - timedelta(days=90)
+        elif since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+
+        page_schema = self._page_schema(fields)
+        fields = tuple(page_schema)
+        page_size = self._page_size(since, resolution)
+
+        aliases = {f'h{i}': home_id for i, home_id in enumerate(home_ids)}
+        frames: Dict[str, List[pl.DataFrame]] = {alias: [] for alias in aliases}
+        cursors: Dict[str, Optional[str]] = {alias: None for alias in aliases}
+        pending = tuple(aliases)
+        page_count = 0
+
+        print(f"📅 Date range: {since.isoformat()} to {until.isoformat()}")
+        print(f"📊 Resolution: {resolution}")
+
+        while pending:
+            page_count += 1
+            print(f"📄 Fetching page {page_count} for {len(pending)} home(s)...")
+
+            variables: Dict[str, Any] = {'resolution': resolution, 'last': page_size}
+            for alias in pending:
+                variables[alias] = aliases[alias]
+                variables[f'{alias}_before'] = cursors[alias]
+
+            response = self._make_request({
+                'query': _multi_home_document(pending, fields),
+                'variables': variables,
+            })
+            viewer = (response.get('data') or {}).get('viewer') or {}
+
+            # Homes whose range reaches further back than this page
+            older = []
+            for alias in pending:
+                try:
+                    consumption = viewer[alias]['consumption']
+                    edges = consumption['edges']
+                    page_info = consumption['pageInfo']
+                except (KeyError, TypeError):
+                    print(f"❌ No consumption data for home {aliases[alias]}")
+                    continue
+
+                if not edges:
+                    continue
+
+                frames[alias].append(
+                    self._page_frame(self._nodes_in_range(edges, since, until), page_schema)
+                )
+
+                oldest_in_page = min(
+                    datetime.fromisoformat(edges[0]['node']['from']),
+                    datetime.fromisoformat(edges[-1]['node']['from'])
+                )
+                if oldest_in_page >= since and page_info.get('hasPreviousPage', False):
+                    cursors[alias] = page_info['startCursor']
+                    older.append(alias)
+
+            pending = tuple(older)
+            if pending:
+                # Continue with full pages for homes that reach further back
+                page_size = MAX_PAGE_SIZE
+                self._pause_between_pages()
+
+        results = {aliases[alias]: self._combine_pages(frames[alias]) for alias in aliases}
+        for home_id, df in results.items():
+            print(f"✅ Home {home_id}: {len(df)} records")
+        return results
+
+    @staticmethod
+    def _page_schema(fields: Tuple[str, ...]) -> Dict[str, Any]:
+        """Polars schema for the requested node fields, always including the key columns"""
+        fields = tuple(dict.fromkeys(('from', 'to') + tuple(fields)))
+        unknown = set(fields) - set(EDGE_SCHEMA)
+        if unknown:
+            raise ValueError(f"Unknown consumption fields: {', '.join(sorted(unknown))}")
+        return {name: EDGE_SCHEMA[name] for name in fields}
+
+    @staticmethod
+    def _nodes_in_range(
+        edges: List[Dict[str, Any]],
+        since: datetime,
+        until: datetime
+    ) -> List[Dict[str, Any]]:
+        """Nodes of a chronological page that fall inside [since, until]"""
+        # Only the O(log n) timestamps bisect visits are parsed
+        def from_time(edge: Dict[str, Any]) -> datetime:
+            return datetime.fromisoformat(edge['node']['from'])
+
+        if from_time(edges[0]) > from_time(edges[-1]):
+            edges = edges[::-1]
+        start = bisect_left(edges, since, key=from_time)
+        end = bisect_right(edges, until, key=from_time)
+        return [edge['node'] for edge in edges[start:end]]
+
+    @staticmethod
+    def _page_frame(nodes: List[Dict[str, Any]], page_schema: Dict[str, Any]) -> pl.DataFrame:
+        """Build a page frame column by column from its nodes"""
+        # One list per column lets Polars build each Arrow array in a single
+        # pass instead of reading every field out of every dict
+        return pl.DataFrame(
+            {name: [node.get(name) for node in nodes] for name in page_schema},
+            schema=page_schema
+        )
+
+    @staticmethod
+    def _page_size(
+        since: datetime,
+        resolution: str,
+        max_records: Optional[int] = None
+    ) -> int:
+        """Records per page needed to reach back from now to since, within MAX_PAGE_SIZE"""
+        span = datetime.now(timezone.utc) - since
+        page_size = math.ceil(span / RESOLUTION_STEPS[resolution]) + 1
+        if max_records:
+            page_size = min(page_size, max_records)
+        return max(1, min(page_size, MAX_PAGE_SIZE))
+
+    @staticmethod
+    def _combine_pages(frames: List[pl.DataFrame]) -> pl.DataFrame:
+        """Concatenate page frames into the full table layout"""
+        if not frames:
+            return pl.DataFrame(schema=EDGE_SCHEMA)
+
+        # One contiguous chunk per column for the Arrow hand-off in save_data
+        df = pl.concat(frames, rechunk=True)
+
+        # Fill fields that weren't requested so the frame matches the table
+        return df.with_columns(
+            pl.lit(None, dtype=dtype).alias(name)
+            for name, dtype in EDGE_SCHEMA.items() if name not in df.columns
+        ).select(list(EDGE_SCHEMA))
     
     def _build_consumption_query(
         self,
         resolution: str = "HOURLY",
-        first: int = 1000,
-        after: Optional[str] = None,
-        last: Optional[int] = None
-    ) -> str:
-        """Build a GraphQL query for consumption data"""
-        after_clause = f', after: "{after}"' if after else ''
-
-        # Use 'last' instead of 'first' to get recent data
-        if last is not None:
-            size_clause = f'last: {last}'
-        else:
-            size_clause = f'first: {first}'
-
-        query = f"""
-        {{
-          viewer {{
-            home(id: "{self.home_id}") {{
-              consumption(resolution: {resolution}, {size_clause}{after_clause}) {{
-                pageInfo {{
-                  hasNextPage
-                  endCursor
-                }}
-                edges {{
-                  node {{
-                    from
-                    to
-                    consumption
-                    consumptionUnit
-                    cost
-                    unitPrice
-                    unitPriceVAT
-                    currency
-                  }}
-                }}
-              }}
-            }}
-          }}
-        }}
-        """
-        return query
+        last: int = 1000,
+        before: Optional[str] = None,
+        fields: Tuple[str, ...] = DEFAULT_FIELDS
+    ) -> Dict[str, Any]:
+        """Build the GraphQL payload for one page of consumption data"""
+        return {
+            'query': _consumption_document(fields),
+            'variables': {
+                'homeId': self.home_id,
+                'resolution': resolution,
+                'last': last,
+                'before': before,
+            },
+        }
     
-    def save_data(self, df: pl.DataFrame, append: bool = True) -> None:
+    def save_data(self, df: pl.DataFrame, append: bool = True, full_refresh: bool = False) -> None:
         """
         Save data to DuckDB database
 
         Args:
             df: DataFrame to save
             append: If True, append to existing data (with deduplication via UPSERT)
+            full_refresh: If True, rebuild all aggregations instead of only
+                the days and months touched by this batch
         """
         if len(df) == 0:
             print("ℹ️  No data to save")
+            if full_refresh:
+                self._update_aggregations()
             return
 
         # Rename columns to match database schema
@@ -428,61 +767,138 @@ class TibberCollector:
             'unitPriceVAT': 'unit_price_vat'
         })
 
-        with duckdb.connect(str(self.db_path)) as con:
-            # Insert or replace data (DuckDB's way of handling duplicates)
+        # Time span of this batch, used to limit the aggregation update
+        from_dt = pl.col('from_time').str.to_datetime(time_unit='us', time_zone='UTC')
+        window = df_renamed.select(from_dt.min(), from_dt.max().alias('last')).row(0)
+
+        con = self.con
+        # Hand the batch to DuckDB as an Arrow table so it is scanned
+        # column-wise in place rather than found by variable lookup
+        con.register('incoming', df_renamed.to_arrow())
+
+        # Write the batch and its aggregations in one transaction so a run
+        # commits once and never leaves the rollups out of sync
+        con.execute("BEGIN TRANSACTION")
+        try:
+            # Deduplicate by deleting overlapping keys, then appending the
+            # batch; incremental runs rarely overlap existing rows
+            deleted = con.execute("""
+                DELETE FROM hourly_consumption h
+                USING incoming s
+                WHERE h.from_time = CAST(s.from_time AS TIMESTAMPTZ)
+                  AND h.to_time = CAST(s.to_time AS TIMESTAMPTZ)
+            """).fetchone()[0]
+            inserted = con.execute("""
+                INSERT INTO hourly_consumption (
+                    from_time, to_time, consumption, consumption_unit,
+                    cost, unit_price, unit_price_vat, currency
+                )
+                SELECT
+                    from_time, to_time, consumption, consumption_unit,
+                    cost, unit_price, unit_price_vat, currency
+                FROM incoming
+            """).fetchone()[0]
+
+            # Advance the stored high-water mark; a backfill of older data
+            # must not move it backwards
             con.execute("""
-                INSERT OR REPLACE INTO hourly_consumption
-                SELECT * FROM df_renamed
+                INSERT OR REPLACE INTO collection_state
+                SELECT 'last_from_time', CAST(GREATEST(
+                    MAX(CAST(from_time AS TIMESTAMPTZ)),
+                    (SELECT CAST(value AS TIMESTAMPTZ) FROM collection_state
+                     WHERE key = 'last_from_time')
+                ) AS VARCHAR)
+                FROM incoming
             """)
 
-            record_count = con.execute("SELECT COUNT(*) FROM hourly_consumption").fetchone()[0]
+            # Keep a running row count instead of counting the table on
+            # every save; older databases are counted once to seed it
+            stored = con.execute(
+                "SELECT CAST(value AS BIGINT) FROM collection_state WHERE key = 'row_count'"
+            ).fetchone()
+            if stored is None:
+                record_count = con.execute("SELECT COUNT(*) FROM hourly_consumption").fetchone()[0]
+            else:
+                record_count = stored[0] + inserted - deleted
+            con.execute(
+                "INSERT OR REPLACE INTO collection_state VALUES ('row_count', ?)",
+                [str(record_count)]
+            )
             print(f"💾 Saved {len(df)} new records")
             print(f"📊 Total records in database: {record_count}")
 
-        # Update aggregation tables
-        self._update_aggregations()
+            # Update aggregation tables
+            self._update_aggregations(None if full_refresh else window)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        finally:
+            con.unregister('incoming')
 
-        print(f"✅ Data saved to {self.db_path}")
+        # The high-water mark may have moved; re-read it on next use
+        self._last_timestamp_loaded = False
 
-    def _update_aggregations(self) -> None:
-        """Update daily and monthly aggregation tables"""
-        with duckdb.connect(str(self.db_path)) as con:
-            # Update daily aggregations
-            con.execute("""
-                INSERT OR REPLACE INTO daily_consumption
-                SELECT
-                    CAST(from_time AS DATE) as date,
-                    SUM(consumption) as total_consumption,
-                    SUM(cost) as total_cost,
-                    AVG(unit_price) as avg_unit_price,
-                    MAX(currency) as currency
-                FROM hourly_consumption
-                WHERE consumption IS NOT NULL
-                GROUP BY CAST(from_time AS DATE)
-            """)
+        print(f"✅ Data saved to {self.db_path}")
 
-            # Update monthly aggregations
-            con.execute("""
-                INSERT OR REPLACE INTO monthly_consumption
-                SELECT
-                    EXTRACT(YEAR FROM from_time) as year,
-                    EXTRACT(MONTH FROM from_time) as month,
-                    SUM(consumption) as total_consumption,
-                    SUM(cost) as total_cost,
-                    AVG(unit_price) as avg_unit_price,
-                    MAX(currency) as currency
-                FROM hourly_consumption
-                WHERE consumption IS NOT NULL
-                GROUP BY EXTRACT(YEAR FROM from_time), EXTRACT(MONTH FROM from_time)
-            """)
+    def _update_aggregations(self, window: Optional[Tuple[datetime, datetime]] = None) -> None:
+        """
+        Update daily and monthly aggregation tables
 
-            print("📊 Updated daily and monthly aggregations")
+        Args:
+            window: (first, last) from_time of the saved batch. Only the days
+                and months it touches are recomputed; None rebuilds everything.
+        """
+        if window is None:
+            daily_filter = monthly_filter = ""
+            params = []
+        else:
+            daily_filter = """
+                    AND from_time >= date_trunc('day', CAST(? AS TIMESTAMPTZ))
+                    AND from_time < date_trunc('day', CAST(? AS TIMESTAMPTZ)) + INTERVAL 1 DAY"""
+            monthly_filter = """
+                    AND from_time >= date_trunc('month', CAST(? AS TIMESTAMPTZ))
+                    AND from_time < date_trunc('month', CAST(? AS TIMESTAMPTZ)) + INTERVAL 1 MONTH"""
+            params = list(window)
+
+        con = self.con
+        # Update daily aggregations
+        con.execute(f"""
+            INSERT OR REPLACE INTO daily_consumption
+            SELECT
+                CAST(from_time AS DATE) as date,
+                SUM(consumption) as total_consumption,
+                SUM(cost) as total_cost,
+                AVG(unit_price) as avg_unit_price,
+                MAX(currency) as currency
+            FROM hourly_consumption
+            WHERE consumption IS NOT NULL{daily_filter}
+            GROUP BY CAST(from_time AS DATE)
+        """, params)
+
+        # Update monthly aggregations
+        con.execute(f"""
+            INSERT OR REPLACE INTO monthly_consumption
+            SELECT
+                EXTRACT(YEAR FROM from_time) as year,
+                EXTRACT(MONTH FROM from_time) as month,
+                SUM(consumption) as total_consumption,
+                SUM(cost) as total_cost,
+                AVG(unit_price) as avg_unit_price,
+                MAX(currency) as currency
+            FROM hourly_consumption
+            WHERE consumption IS NOT NULL{monthly_filter}
+            GROUP BY EXTRACT(YEAR FROM from_time), EXTRACT(MONTH FROM from_time)
+        """, params)
+
+        print("📊 Updated daily and monthly aggregations")
     
     def collect(
         self,
         since: Optional[datetime] = None,
         until: Optional[datetime] = None,
-        resolution: str = "HOURLY"
+        resolution: str = "HOURLY",
+        full_refresh: bool = False
     ) -> pl.DataFrame:
         """
         Main collection method: fetch and save data
@@ -491,12 +907,21 @@ class TibberCollector:
             since: Start datetime (auto-detects if None)
             until: End datetime (defaults to now)
             resolution: Data resolution (HOURLY, DAILY, WEEKLY, MONTHLY, ANNUAL)
+            full_refresh: Rebuild all aggregation tables after saving
             
         Returns:
             DataFrame with collected data
         """
         print("🚀 Starting Tibber data collection")
         print(f"🏠 Home ID: {self.home_id}")
+
+        # The hour after the last stored one is only published once it has
+        # ended, so an incremental run before then cannot find anything new
+        if since is None and until is None and not full_refresh:
+            last_timestamp = self._get_last_timestamp()
+            if last_timestamp and datetime.now(timezone.utc) < last_timestamp + timedelta(hours=2):
+                print(f"⏭️  Up to date (last record {last_timestamp.isoformat()}), skipping fetch")
+                return pl.DataFrame(schema=EDGE_SCHEMA)
         
         df = self.fetch_consumption_data(
             since=since,
@@ -504,7 +929,7 @@ class TibberCollector:
             resolution=resolution
         )
         
-        self.save_data(df, append=True)
+        self.save_data(df, append=True, full_refresh=full_refresh)
         
         return df
 
@@ -543,6 +968,11 @@ def main():
         '--until',
         help='End date (ISO format: 2024-12-31T23:59:59)'
     )
+    parser.add_argument(
+        '--full-refresh',
+        action='store_true',
+        help='Rebuild daily and monthly aggregations from all hourly data'
+    )
     
     args = parser.parse_args()
     
@@ -551,17 +981,17 @@ def main():
     until = datetime.fromisoformat(args.until) if args.until else None
     
     # Create collector and run
-    collector = TibberCollector(
+    with TibberCollector(
         access_token=args.token,
         home_id=args.home_id,
         db_path=args.db_path
-    )
-    
-    collector.collect(
-        since=since,
-        until=until,
-        resolution=args.resolution
-    )
+    ) as collector:
+        collector.collect(
+            since=since,
+            until=until,
+            resolution=args.resolution,
+            full_refresh=args.full_refresh
+        )
 
 
 if __name__ == "__main__":
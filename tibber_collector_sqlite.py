@@ -7,10 +7,13 @@ Collects energy consumption data from Tibber's GraphQL API and stores it in SQLi
 import httpx
 import sqlite3
 import json
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta, timezone
+from itertools import chain, islice
+from operator import itemgetter
 from pathlib import Path
 import os
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, Iterator, List
 import time
 import sys
 
@@ -21,6 +24,84 @@ try:
 except ImportError:
     pass
 
+# Use the ciso8601 C parser for API timestamps when it is installed
+try:
+    from ciso8601 import parse_datetime as _parse_time
+except ImportError:
+    def _parse_time(value: str) -> datetime:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+# orjson encodes and decodes request bodies from bytes directly when installed
+try:
+    from orjson import dumps as _dumps, loads as _loads
+except ImportError:
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode()
+
+    _loads = json.loads
+
+# Pause between pages only once the remaining request quota drops this low
+RATE_LIMIT_LOW_WATERMARK = 50
+
+# Rows per multi-row INSERT; 62 x 9 parameters stays under the 999
+# variable limit of older SQLite builds
+ROWS_PER_INSERT = 62
+
+INSERT_HOURLY_PREFIX = """
+    INSERT OR REPLACE INTO hourly_consumption
+    (from_time, to_time, consumption, consumption_unit, cost, unit_price, unit_price_vat, currency, from_ts)
+    VALUES """
+ROW_PLACEHOLDERS = "(?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+# Built once so every full chunk hits sqlite3's statement cache
+INSERT_HOURLY_SQL = INSERT_HOURLY_PREFIX + ", ".join([ROW_PLACEHOLDERS] * ROWS_PER_INSERT)
+
+
+# Static consumption query; pagination values are sent as variables so the
+# document is identical on every request
+CONSUMPTION_QUERY = """
+query Consumption($homeId: ID!, $resolution: EnergyResolution!, $last: Int, $before: String) {
+  viewer {
+    home(id: $homeId) {
+      consumption(resolution: $resolution, last: $last, before: $before) {
+        pageInfo {
+          hasPreviousPage
+          startCursor
+        }
+        edges {
+          node {
+            from
+            to
+            consumption
+            consumptionUnit
+            cost
+            unitPrice
+            unitPriceVAT
+            currency
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+def _row(record: Dict[str, Any]) -> tuple:
+    """Map a consumption node to an hourly_consumption row"""
+    return (
+        record['from'],
+        record['to'],
+        record.get('consumption'),
+        record.get('consumptionUnit'),
+        record.get('cost'),
+        record.get('unitPrice'),
+        record.get('unitPriceVAT'),
+        record.get('currency'),
+        int(_parse_time(record['from']).timestamp())
+    )
+
+
 class TibberCollector:
     """Collects energy consumption data from Tibber API"""
 
@@ -54,18 +135,56 @@ class TibberCollector:
             'Content-Type': 'application/json',
             'Authorization': f'Bearer {self.access_token}'
         }
+        # One keep-alive client for every page instead of a new connection per request
+        self._client = httpx.Client(
+            http2=True,
+            headers=self.headers,
+            limits=httpx.Limits(max_keepalive_connections=4),
+            timeout=60.0
+        )
+        # Remaining request quota reported by the API, if it sends one, and
+        # when that quota resets (time.monotonic() deadline)
+        self._rate_remaining: Optional[int] = None
+        self._rate_reset_at: Optional[float] = None
 
         if not self.home_id:
             # Try to fetch home ID automatically
             self.home_id = self._get_home_id()
 
+        # One long-lived connection keeps the page cache warm across calls
+        self.con = self._connect()
+
         # Initialize database
         self._init_database()
 
+        # Newest stored from time, read once and then advanced by our own saves
+        self._last_timestamp: Optional[datetime] = None
+        self._last_timestamp_loaded = False
+
+    def __enter__(self) -> "TibberCollector":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the HTTP connection pool and the database connection"""
+        self._client.close()
+        self.con.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a database connection tuned for write-heavy collection"""
+        con = sqlite3.connect(str(self.db_path))
+        # WAL keeps readers (the API) unblocked while the collector writes
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.execute("PRAGMA temp_store=MEMORY")
+        con.execute("PRAGMA cache_size=-65536")
+        return con
+
     def _init_database(self) -> None:
         """Initialize SQLite database and create tables if they don't exist"""
-        con = sqlite3.connect(str(self.db_path))
-        cur = con.cursor()
+        cur = self.con.cursor()
 
         # Create hourly consumption table
         cur.execute("""
@@ -78,10 +197,30 @@ class TibberCollector:
                 unit_price REAL,
                 unit_price_vat REAL,
                 currency TEXT,
+                from_ts INTEGER,
                 PRIMARY KEY (from_time, to_time)
             )
         """)
 
+        # from_ts is from_time as Unix epoch seconds: unlike the offset-carrying
+        # strings it orders chronologically and compares as a plain integer
+        try:
+            cur.execute("ALTER TABLE hourly_consumption ADD COLUMN from_ts INTEGER")
+        except sqlite3.OperationalError:
+            pass  # Column already exists
+        cur.execute("""
+            UPDATE hourly_consumption
+            SET from_ts = CAST(strftime('%s', from_time) AS INTEGER)
+            WHERE from_ts IS NULL
+        """)
+
+        # Covering index so MAX(from_ts) is a single seek and the windowed
+        # re-aggregation is an index range scan over just the touched rows
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_hc_from_ts
+            ON hourly_consumption(from_ts, consumption, cost, unit_price, currency)
+        """)
+
         # Create daily aggregation table
         cur.execute("""
             CREATE TABLE IF NOT EXISTS daily_consumption (
@@ -106,8 +245,22 @@ class TibberCollector:
             )
         """)
 
-        con.commit()
-        con.close()
+        # Tables written by convert_duckdb_to_sqlite.py have no primary keys;
+        # a unique index gives INSERT OR REPLACE and the rollup upserts their
+        # conflict target there
+        for table, columns in (
+            ('hourly_consumption', ('from_time', 'to_time')),
+            ('daily_consumption', ('date',)),
+            ('monthly_consumption', ('year', 'month')),
+        ):
+            table_info = cur.execute(f"PRAGMA table_info({table})").fetchall()
+            if not any(column[5] for column in table_info):
+                cur.execute(
+                    f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_key "
+                    f"ON {table}({', '.join(columns)})"
+                )
+
+        self.con.commit()
         print(f"✅ Database initialized at {self.db_path}")
 
     def _get_home_id(self) -> str:
@@ -140,24 +293,20 @@ class TibberCollector:
         """Make a GraphQL request with retry logic"""
         for attempt in range(retries):
             try:
-                response = httpx.post(
-                    self.api_url,
-                    json=payload,
-                    headers=self.headers,
-                    timeout=60.0
-                )
+                response = self._client.post(self.api_url, content=_dumps(payload))
+                self._record_rate_limit(response)
 
                 if response.status_code == 200:
-                    data = response.json()
+                    data = _loads(response.content)
                     if 'errors' in data:
                         print(f"⚠️  GraphQL errors: {data['errors']}")
                     return data
                 elif response.status_code == 429:
-                    wait_time = 2 ** attempt
+                    wait_time = self._retry_delay(response, attempt)
                     print(f"⚠️  Rate limited. Waiting {wait_time}s before retry...")
                     time.sleep(wait_time)
                 elif response.status_code == 504:
-                    wait_time = 2 ** attempt
+                    wait_time = self._retry_delay(response, attempt)
                     print(f"⚠️  Gateway timeout. Waiting {wait_time}s before retry...")
                     time.sleep(wait_time)
                 else:
@@ -170,21 +319,61 @@ class TibberCollector:
 
         raise Exception(f"Failed to make request after {retries} attempts")
 
+    def _record_rate_limit(self, response: httpx.Response) -> None:
+        """Remember the quota and reset time from X-RateLimit-* headers"""
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        if remaining is not None and remaining.isdigit():
+            self._rate_remaining = int(remaining)
+
+        reset = response.headers.get('X-RateLimit-Reset')
+        try:
+            reset_in = float(reset)
+        except (TypeError, ValueError):
+            return
+        # Servers send either seconds until reset or an epoch timestamp
+        if reset_in > 1e9:
+            reset_in -= time.time()
+        self._rate_reset_at = time.monotonic() + max(0.0, reset_in)
+
+    def _pause_between_pages(self) -> None:
+        """Pace page requests by the reported quota, skipping the pause while plenty is left"""
+        remaining = self._rate_remaining
+        if remaining is not None and remaining > RATE_LIMIT_LOW_WATERMARK:
+            return
+
+        delay = 0.3
+        if remaining is not None and self._rate_reset_at is not None:
+            # Spread what is left of the quota over the time until it resets
+            reset_in = self._rate_reset_at - time.monotonic()
+            delay = max(delay, reset_in / max(remaining, 1))
+        time.sleep(min(delay, 60.0))
+
+    @staticmethod
+    def _retry_delay(response: httpx.Response, attempt: int) -> float:
+        """Seconds to wait before retrying, preferring the server's Retry-After hint"""
+        retry_after = response.headers.get('Retry-After')
+        try:
+            return max(0.0, float(retry_after))
+        except (TypeError, ValueError):
+            return 2 ** attempt
+
     def _get_last_timestamp(self) -> Optional[datetime]:
         """Get the timestamp of the most recent data point in storage"""
+        if self._last_timestamp_loaded:
+            return self._last_timestamp
+
         try:
-            con = sqlite3.connect(str(self.db_path))
-            cur = con.cursor()
-            cur.execute("""
-                SELECT MAX(from_time) as last_time
+            result = self.con.execute("""
+                SELECT MAX(from_ts) as last_ts
                 FROM hourly_consumption
-            """)
-            result = cur.fetchone()
-            con.close()
+            """).fetchone()
 
-            if result and result[0]:
-                return datetime.fromisoformat(result[0])
-            return None
+            if result and result[0] is not None:
+                self._last_timestamp = datetime.fromtimestamp(result[0], timezone.utc)
+            else:
+                self._last_timestamp = None
+            self._last_timestamp_loaded = True
+            return self._last_timestamp
         except Exception as e:
             print(f"⚠️  Could not read last timestamp: {e}")
             return None
@@ -196,6 +385,19 @@ class TibberCollector:
         resolution: str = "HOURLY"
     ) -> List[Dict[str, Any]]:
         """Fetch consumption data with pagination"""
+        records = list(chain.from_iterable(
+            self.iter_consumption_pages(since=since, until=until, resolution=resolution)
+        ))
+        print(f"✅ Final dataset: {len(records)} records")
+        return records
+
+    def iter_consumption_pages(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        resolution: str = "HOURLY"
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """Yield the nodes of each fetched page inside the date range, newest page first"""
 
         # Determine date range
         if until is None:
@@ -218,7 +420,7 @@ class TibberCollector:
         print(f"📊 Resolution: {resolution}")
 
         # Fetch all pages
-        all_records = []
+        collected = 0
         cursor = None
         page_count = 0
         page_size = 1000
@@ -227,17 +429,16 @@ class TibberCollector:
             page_count += 1
             print(f"📄 Fetching page {page_count}...")
 
-            # Build query
-            if cursor is None:
-                query = self._build_consumption_query(resolution=resolution, last=page_size)
-            else:
-                query = self._build_consumption_query(
-                    resolution=resolution,
-                    first=page_size,
-                    after=cursor
-                )
-
-            response = self._make_request({'query': query})
+            # Walk backwards from the newest record, one page before the other
+            response = self._make_request({
+                'query': CONSUMPTION_QUERY,
+                'variables': {
+                    'homeId': self.home_id,
+                    'resolution': resolution,
+                    'last': page_size,
+                    'before': cursor
+                }
+            })
 
             # Extract data
             try:
@@ -255,93 +456,45 @@ class TibberCollector:
                 break
 
             # Check date range
-            if edges:
-                first_date_str = edges[0]['node']['from']
-                last_date_str = edges[-1]['node']['from']
-
-                first_date = datetime.fromisoformat(first_date_str.replace('Z', '+00:00'))
-                last_date = datetime.fromisoformat(last_date_str.replace('Z', '+00:00'))
-
-                print(f"   Date range: {first_date} to {last_date}")
-
-                oldest_in_page = min(first_date, last_date)
-                if since and oldest_in_page < since:
-                    print(f"✅ Reached target start date ({since})")
-                    edges = [
-                        e for e in edges
-                        if datetime.fromisoformat(e['node']['from'].replace('Z', '+00:00')) >= since
-                    ]
-                    all_records.extend([edge['node'] for edge in edges])
-                    break
-
-            all_records.extend([edge['node'] for edge in edges])
+            first_date = _parse_time(edges[0]['node']['from'])
+            last_date = _parse_time(edges[-1]['node']['from'])
+            print(f"   Date range: {first_date} to {last_date}")
+
+            # Keep only the part of the page inside [since, until]
+            nodes = self._nodes_in_range(edges, since, until)
+            if nodes:
+                collected += len(nodes)
+                yield nodes
+
+            if min(first_date, last_date) < since:
+                print(f"✅ Reached target start date ({since})")
+                break
 
-            if not page_info.get('hasNextPage', False):
+            if not page_info.get('hasPreviousPage', False):
                 print("✅ No more pages available")
                 break
 
-            cursor = page_info['endCursor']
-            time.sleep(0.3)
+            cursor = page_info['startCursor']
+            self._pause_between_pages()
 
-        print(f"\n📊 Total records collected: {len(all_records)}")
+        print(f"\n📊 Total records collected: {collected}")
 
-        # Filter by date range
-        if since or until:
-            filtered = []
-            for record in all_records:
-                record_time = datetime.fromisoformat(record['from'].replace('Z', '+00:00'))
-                if since and record_time < since:
-                    continue
-                if until and record_time > until:
-                    continue
-                filtered.append(record)
-            all_records = filtered
-
-        print(f"✅ Final dataset: {len(all_records)} records")
-        return all_records
+    @staticmethod
+    def _nodes_in_range(
+        edges: List[Dict[str, Any]],
+        since: datetime,
+        until: datetime
+    ) -> List[Dict[str, Any]]:
+        """Nodes of a chronological page that fall inside [since, until]"""
+        # Only the O(log n) timestamps bisect visits are parsed
+        def from_time(edge: Dict[str, Any]) -> datetime:
+            return _parse_time(edge['node']['from'])
 
-    def _build_consumption_query(
-        self,
-        resolution: str = "HOURLY",
-        first: int = 1000,
-        after: Optional[str] = None,
-        last: Optional[int] = None
-    ) -> str:
-        """Build a GraphQL query for consumption data"""
-        after_clause = f', after: "{after}"' if after else ''
-
-        if last is not None:
-            size_clause = f'last: {last}'
-        else:
-            size_clause = f'first: {first}'
-
-        query = f"""
-        {{
-          viewer {{
-            home(id: "{self.home_id}") {{
-              consumption(resolution: {resolution}, {size_clause}{after_clause}) {{
-                pageInfo {{
-                  hasNextPage
-                  endCursor
-                }}
-                edges {{
-                  node {{
-                    from
-                    to
-                    consumption
-                    consumptionUnit
-                    cost
-                    unitPrice
-                    unitPriceVAT
-                    currency
-                  }}
-                }}
-              }}
-            }}
-          }}
-        }}
-        """
-        return query
+        if from_time(edges[0]) > from_time(edges[-1]):
+            edges = edges[::-1]
+        start = bisect_left(edges, since, key=from_time)
+        end = bisect_right(edges, until, key=from_time)
+        return list(map(itemgetter('node'), islice(edges, start, end)))
 
     def save_data(self, records: List[Dict[str, Any]]) -> None:
         """Save data to SQLite database"""
@@ -349,76 +502,115 @@ class TibberCollector:
             print("ℹ️  No data to save")
             return
 
-        con = sqlite3.connect(str(self.db_path))
-        cur = con.cursor()
-
-        # Insert or replace data
-        for record in records:
-            cur.execute("""
-                INSERT OR REPLACE INTO hourly_consumption
-                (from_time, to_time, consumption, consumption_unit, cost, unit_price, unit_price_vat, currency)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                record['from'],
-                record['to'],
-                record.get('consumption'),
-                record.get('consumptionUnit'),
-                record.get('cost'),
-                record.get('unitPrice'),
-                record.get('unitPriceVAT'),
-                record.get('currency')
-            ))
-
-        con.commit()
-
-        cur.execute("SELECT COUNT(*) FROM hourly_consumption")
-        record_count = cur.fetchone()[0]
-        print(f"💾 Saved {len(records)} new records")
-        print(f"📊 Total records in database: {record_count}")
+        times = [_parse_time(record['from']) for record in records]
+
+        # Insert or replace all rows and refresh the days/months they touch
+        # in one transaction (one commit, not one per row)
+        with self.con:
+            self._insert_batch(records)
+            self._update_aggregations(min(times).isoformat(), max(times).isoformat())
+
+        self._finish_save(len(records), max(times))
 
-        con.close()
+    def _insert_batch(self, records: List[Dict[str, Any]]) -> None:
+        """Insert or replace hourly rows; the caller owns the transaction"""
+        # One statement per chunk of rows is parsed and stepped once instead
+        # of binding and stepping a single-row statement for every record
+        rows = map(_row, records)
+        while True:
+            chunk = list(islice(rows, ROWS_PER_INSERT))
+            if not chunk:
+                break
+            if len(chunk) == ROWS_PER_INSERT:
+                sql = INSERT_HOURLY_SQL
+            else:
+                sql = INSERT_HOURLY_PREFIX + ", ".join([ROW_PLACEHOLDERS] * len(chunk))
+            self.con.execute(sql, [value for row in chunk for value in row])
 
-        # Update aggregations
-        self._update_aggregations()
+    def _finish_save(self, saved: int, newest: datetime) -> None:
+        """Report a completed save"""
+        record_count = self.con.execute("SELECT COUNT(*) FROM hourly_consumption").fetchone()[0]
+        print(f"💾 Saved {saved} new records")
+        print(f"📊 Total records in database: {record_count}")
+
+        # Advance the cached last timestamp instead of querying it again
+        if self._last_timestamp_loaded:
+            if self._last_timestamp is None or newest > self._last_timestamp:
+                self._last_timestamp = newest.astimezone(timezone.utc)
 
         print(f"✅ Data saved to {self.db_path}")
 
-    def _update_aggregations(self) -> None:
-        """Update daily and monthly aggregation tables"""
-        con = sqlite3.connect(str(self.db_path))
-        cur = con.cursor()
+    def _update_aggregations(
+        self,
+        min_from: Optional[str] = None,
+        max_from: Optional[str] = None
+    ) -> None:
+        """Update daily and monthly aggregation tables (all history if no range is given)
+
+        Runs inside the caller's transaction; callers wrap it in `with self.con:`.
+        """
+        cur = self.con.cursor()
+
+        # Widen the range to whole (UTC) days/months as epoch bounds on from_ts
+        if min_from and max_from:
+            day_filter = """
+                AND from_ts >= CAST(strftime('%s', ?, 'start of day') AS INTEGER)
+                AND from_ts < CAST(strftime('%s', ?, 'start of day', '+1 day') AS INTEGER)
+            """
+            month_filter = """
+                AND from_ts >= CAST(strftime('%s', ?, 'start of month') AS INTEGER)
+                AND from_ts < CAST(strftime('%s', ?, 'start of month', '+1 month') AS INTEGER)
+            """
+            params = (min_from, max_from)
+        else:
+            day_filter = month_filter = ""
+            params = ()
+
+        # Recomputed buckets are upserted in place rather than REPLACE's delete
+        # and re-insert; they are not added to, since a re-fetched hour replaces
+        # its old hourly row and must not be counted twice
 
         # Update daily aggregations
-        cur.execute("""
-            INSERT OR REPLACE INTO daily_consumption
+        cur.execute(f"""
+            INSERT INTO daily_consumption
             SELECT
-                DATE(from_time) as date,
+                DATE(from_ts, 'unixepoch') as date,
                 SUM(consumption) as total_consumption,
                 SUM(cost) as total_cost,
                 AVG(unit_price) as avg_unit_price,
                 MAX(currency) as currency
             FROM hourly_consumption
             WHERE consumption IS NOT NULL
-            GROUP BY DATE(from_time)
-        """)
+            {day_filter}
+            GROUP BY DATE(from_ts, 'unixepoch')
+            ON CONFLICT(date) DO UPDATE SET
+                total_consumption = excluded.total_consumption,
+                total_cost = excluded.total_cost,
+                avg_unit_price = excluded.avg_unit_price,
+                currency = excluded.currency
+        """, params)
 
         # Update monthly aggregations
-        cur.execute("""
-            INSERT OR REPLACE INTO monthly_consumption
+        cur.execute(f"""
+            INSERT INTO monthly_consumption
             SELECT
-                CAST(strftime('%Y', from_time) AS INTEGER) as year,
-                CAST(strftime('%m', from_time) AS INTEGER) as month,
+                CAST(strftime('%Y', from_ts, 'unixepoch') AS INTEGER) as year,
+                CAST(strftime('%m', from_ts, 'unixepoch') AS INTEGER) as month,
                 SUM(consumption) as total_consumption,
                 SUM(cost) as total_cost,
                 AVG(unit_price) as avg_unit_price,
                 MAX(currency) as currency
             FROM hourly_consumption
             WHERE consumption IS NOT NULL
-            GROUP BY strftime('%Y', from_time), strftime('%m', from_time)
-        """)
+            {month_filter}
+            GROUP BY strftime('%Y-%m', from_ts, 'unixepoch')
+            ON CONFLICT(year, month) DO UPDATE SET
+                total_consumption = excluded.total_consumption,
+                total_cost = excluded.total_cost,
+                avg_unit_price = excluded.avg_unit_price,
+                currency = excluded.currency
+        """, params)
 
-        con.commit()
-        con.close()
         print("📊 Updated daily and monthly aggregations")
 
     def collect(
@@ -441,6 +633,36 @@ class TibberCollector:
 
         return records
 
+    def collect_streaming(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        resolution: str = "HOURLY"
+    ) -> int:
+        """Fetch and save data page by page, returning the number of records saved"""
+        print("🚀 Starting Tibber data collection")
+        print(f"🏠 Home ID: {self.home_id}")
+
+        saved = 0
+        newest = None
+
+        # Each page is committed with its aggregations as soon as it arrives,
+        # so memory stays at one page and no transaction spans a network wait
+        for page in self.iter_consumption_pages(since=since, until=until, resolution=resolution):
+            first = _parse_time(page[0]['from'])
+            last = _parse_time(page[-1]['from'])
+            with self.con:
+                self._insert_batch(page)
+                self._update_aggregations(first.isoformat(), last.isoformat())
+            saved += len(page)
+            newest = last if newest is None else max(newest, last)
+
+        if saved == 0:
+            print("ℹ️  No data to save")
+            return saved
+
+        self._finish_save(saved, newest)
+        return saved
 
 def main():
     """Main entry point for CLI usage"""
@@ -484,17 +706,16 @@ def main():
     until = datetime.fromisoformat(args.until) if args.until else None
 
     # Create collector and run
-    collector = TibberCollector(
+    with TibberCollector(
         access_token=args.token,
         home_id=args.home_id,
         db_path=args.db_path
-    )
-
-    collector.collect(
-        since=since,
-        until=until,
-        resolution=args.resolution
-    )
+    ) as collector:
+        collector.collect_streaming(
+            since=since,
+            until=until,
+            resolution=args.resolution
+        )
 
 
 if __name__ == "__main__":